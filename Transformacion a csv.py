@@ -1,7 +1,15 @@
-import pandas as pd
+import argparse
+import csv
+import gzip
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, time
+from itertools import islice
 from pathlib import Path
 import logging
+import re
+
+from valores_nulos import VALORES_NULOS
 
 # Configuración del logging
 logging.basicConfig(
@@ -10,26 +18,251 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Números enteros guardados como texto (con ceros a la izquierda o espacios)
+PATRON_ENTERO = re.compile(r'\s*[-+]?\d+\s*')
+
 def verificar_dependencias():
     """
     Verifica que todas las dependencias necesarias estén instaladas.
     """
     try:
         import xlrd
-        import openpyxl
+        import python_calamine
         logger.info("Todas las dependencias están instaladas correctamente.")
         return True
     except ImportError as e:
         logger.error(f"Falta una dependencia necesaria: {str(e)}")
-        logger.info("Por favor, instala las dependencias con: pip install pandas openpyxl xlrd>=2.0.1")
+        logger.info("Por favor, instala las dependencias con: pip install xlrd>=2.0.1 python-calamine")
         return False
 
-def convertir_excel_a_csv(ruta_archivo):
+def normalizar_celda(valor):
+    """
+    Ajusta el valor de una celda de Excel para escribirlo en el CSV igual que pandas.
+    """
+    # Los números enteros se guardan como flotantes en Excel
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    # pandas lee las fechas como fecha y hora; fuera de una columna de fechas
+    # se escriben completas, incluida la medianoche
+    if isinstance(valor, date) and not isinstance(valor, datetime):
+        return datetime.combine(valor, time(0))
+    return valor
+
+def nombrar_columnas(encabezado):
+    """
+    Ajusta los nombres de las columnas de una hoja igual que pandas.
+    
+    Las columnas sin nombre se llaman 'Unnamed: N' (N es su posición) y los
+    nombres repetidos reciben un sufijo '.1', '.2', etc.
+    
+    Args:
+        encabezado (list): Valores de la fila de encabezado de la hoja
+        
+    Returns:
+        list: Nombres de las columnas para el CSV
+    """
+    nombres = []
+    sin_nombre = []
+    for i, valor in enumerate(encabezado):
+        nombre = normalizar_celda(valor)
+        if nombre is None or nombre == '':
+            nombre = f"Unnamed: {i}"
+            sin_nombre.append(i)
+        nombres.append(nombre)
+    
+    # Igual que pandas: primero las columnas con nombre y luego las demás, y
+    # los sufijos que ya están en el encabezado se saltan
+    orden = [i for i in range(len(nombres)) if i not in sin_nombre] + sin_nombre
+    conteos = {}
+    for i in orden:
+        base = nombre = nombres[i]
+        repeticiones = conteos.get(nombre, 0)
+        while repeticiones > 0:
+            conteos[base] = repeticiones + 1
+            nombre = f"{base}.{repeticiones}"
+            if nombre in nombres:
+                repeticiones += 1
+            else:
+                repeticiones = conteos.get(nombre, 0)
+        nombres[i] = nombre
+        conteos[nombre] = repeticiones + 1
+    return nombres
+
+def es_nulo(valor):
+    """
+    Indica si pandas leería el valor de una celda como nulo.
+    """
+    return valor is None or (isinstance(valor, str) and valor in VALORES_NULOS)
+
+def convertir_numero(valor):
+    """
+    Convierte el valor de una celda a número como lo haría pandas.
+    
+    Returns:
+        int o float: El valor numérico, o None si la celda no es un número
+    """
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, float):
+        return int(valor) if valor.is_integer() else valor
+    if isinstance(valor, str) and '_' not in valor:
+        if PATRON_ENTERO.fullmatch(valor):
+            return int(valor)
+        try:
+            return float(valor)
+        except ValueError:
+            return None
+    return None
+
+def inferir_tipos_columnas(filas, num_columnas):
+    """
+    Determina qué columnas de una hoja convierte pandas a número al leerla.
+    
+    pandas decide el tipo de cada columna completa: si todos sus valores no
+    nulos son números, la columna es numérica (entera si además no tiene
+    nulos, decimal en otro caso); si todos son fechas y ninguna tiene hora,
+    se escribe solo la parte de fecha; si no, se deja como texto.
+    
+    Args:
+        filas (iterable): Filas de datos de la hoja, sin el encabezado
+        num_columnas (int): Número de columnas del encabezado
+        
+    Returns:
+        list: Por columna, 'int', 'float', 'fecha' o None si es una columna de texto
+    """
+    numericas = [True] * num_columnas
+    enteras = [True] * num_columnas
+    # Columnas cuyos valores no nulos son todos fechas a medianoche
+    fechas = [True] * num_columnas
+    for fila in filas:
+        for i in range(num_columnas):
+            if not (numericas[i] or fechas[i]):
+                continue
+            valor = fila[i] if i < len(fila) else None
+            if es_nulo(valor):
+                enteras[i] = False
+                continue
+            if fechas[i]:
+                fecha = normalizar_celda(valor)
+                fechas[i] = isinstance(fecha, datetime) and fecha.time() == time(0)
+            if numericas[i]:
+                numero = convertir_numero(valor)
+                if numero is None:
+                    numericas[i] = False
+                elif not isinstance(numero, int):
+                    enteras[i] = False
+    return [
+        'int' if numerica and entera else
+        'float' if numerica else
+        'fecha' if fecha else None
+        for numerica, entera, fecha in zip(numericas, enteras, fechas)
+    ]
+
+def convertir_fila(fila, tipos):
+    """
+    Prepara una fila de datos para el CSV según los tipos de sus columnas.
+    """
+    valores = []
+    for i, tipo in enumerate(tipos):
+        valor = fila[i] if i < len(fila) else None
+        if es_nulo(valor):
+            valores.append('')
+        elif tipo == 'int':
+            valores.append(convertir_numero(valor))
+        elif tipo == 'float':
+            valores.append(float(convertir_numero(valor)))
+        elif tipo == 'fecha':
+            valores.append(normalizar_celda(valor).date())
+        else:
+            valores.append(normalizar_celda(valor))
+    return valores
+
+def escribir_hoja_csv(f, leer_filas):
+    """
+    Escribe una hoja en un archivo CSV abierto con el mismo formato que pandas.
+    
+    La hoja se recorre dos veces: la primera solo para decidir el tipo de cada
+    columna y la segunda para escribir, de modo que en memoria solo hay una
+    fila a la vez.
+    
+    Args:
+        f (file): Archivo de texto abierto para escritura
+        leer_filas (callable): Devuelve un iterador nuevo sobre las filas de la hoja
+    """
+    filas = leer_filas()
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return
+    
+    tipos = inferir_tipos_columnas(islice(leer_filas(), 1, None), len(encabezado))
+    
+    writer = csv.writer(f, lineterminator=os.linesep)
+    writer.writerow(nombrar_columnas(encabezado))
+    writer.writerows(convertir_fila(fila, tipos) for fila in filas)
+
+def leer_hojas_xlsx(ruta_archivo):
+    """
+    Recorre las hojas de un archivo .xlsx usando calamine.
+    
+    El libro se abre una sola vez para todas las hojas. Cada hoja debe
+    consumirse por completo antes de pasar a la siguiente.
+    
+    Yields:
+        tuple: Nombre de la hoja y función que devuelve un iterador de sus filas
+    """
+    from python_calamine import CalamineWorkbook
+    
+    wb = CalamineWorkbook.from_path(ruta_archivo)
+    for nombre_hoja in wb.sheet_names:
+        hoja = wb.get_sheet_by_name(nombre_hoja)
+        # iter_rows entrega una fila a la vez en lugar de la hoja completa como listas
+        yield nombre_hoja, hoja.iter_rows
+
+def leer_hojas_xls(ruta_archivo):
+    """
+    Recorre las hojas de un archivo .xls usando xlrd.
+    
+    El libro se abre una sola vez para todas las hojas. Cada hoja debe
+    consumirse por completo antes de pasar a la siguiente.
+    
+    Yields:
+        tuple: Nombre de la hoja y función que devuelve un iterador de sus filas
+    """
+    import xlrd
+    
+    def leer_fila(fila, datemode):
+        valores = []
+        for celda in fila:
+            if celda.ctype == xlrd.XL_CELL_DATE:
+                valores.append(xlrd.xldate_as_datetime(celda.value, datemode))
+            else:
+                valores.append(celda.value)
+        return valores
+    
+    # on_demand carga cada hoja solo cuando se necesita
+    wb = xlrd.open_workbook(ruta_archivo, on_demand=True)
+    try:
+        for nombre_hoja in wb.sheet_names():
+            hoja = wb.sheet_by_name(nombre_hoja)
+            yield nombre_hoja, lambda: (leer_fila(fila, wb.datemode) for fila in hoja.get_rows())
+            wb.unload_sheet(nombre_hoja)
+    finally:
+        wb.release_resources()
+
+def convertir_excel_a_csv(ruta_archivo, comprimir=False):
     """
     Convierte un archivo Excel (xlsx o xls) a formato CSV.
     
+    Las filas se escriben en el CSV a medida que se leen, sin construir un DataFrame.
+    La primera hoja se guarda como <nombre>.csv y las demás como
+    hoja_<hoja>_<nombre>.csv, un nombre que no empieza por Datos_ y por tanto
+    no se mezcla con los datos al combinar los archivos Datos_*.csv.
+    
     Args:
         ruta_archivo (str): Ruta del archivo Excel a convertir
+        comprimir (bool): Si es True se escribe <nombre>.csv.gz comprimido con gzip
         
     Returns:
         bool: True si la conversión fue exitosa, False en caso contrario
@@ -37,7 +270,6 @@ def convertir_excel_a_csv(ruta_archivo):
     try:
         # Obtener el nombre del archivo sin la extensión
         nombre_base = Path(ruta_archivo).stem
-        ruta_csv = f"{nombre_base}.csv"
         
         # Determinar el tipo de archivo
         extension = Path(ruta_archivo).suffix.lower()
@@ -45,25 +277,35 @@ def convertir_excel_a_csv(ruta_archivo):
         # Leer el archivo Excel
         logger.info(f"Leyendo archivo: {ruta_archivo}")
         if extension == '.xls':
-            df = pd.read_excel(ruta_archivo, engine='xlrd')
+            hojas = leer_hojas_xls(ruta_archivo)
         else:  # .xlsx
-            df = pd.read_excel(ruta_archivo, engine='openpyxl')
+            hojas = leer_hojas_xlsx(ruta_archivo)
         
-        # Guardar como CSV
-        df.to_csv(ruta_csv, index=False, encoding='utf-8')
-        logger.info(f"Archivo convertido exitosamente: {ruta_csv}")
+        # Guardar cada hoja como CSV
+        for indice, (nombre_hoja, leer_filas) in enumerate(hojas):
+            ruta_csv = f"{nombre_base}.csv" if indice == 0 else f"hoja_{nombre_hoja}_{nombre_base}.csv"
+            if comprimir:
+                # Nivel 1: compresión rápida, suficiente para reducir la escritura a disco
+                ruta_csv += '.gz'
+                f = gzip.open(ruta_csv, 'wt', newline='', encoding='utf-8', compresslevel=1)
+            else:
+                f = open(ruta_csv, 'w', newline='', encoding='utf-8')
+            with f:
+                escribir_hoja_csv(f, leer_filas)
+            logger.info(f"Archivo convertido exitosamente: {ruta_csv}")
         return True
         
     except Exception as e:
         logger.error(f"Error al convertir {ruta_archivo}: {str(e)}")
         return False
 
-def procesar_directorio(directorio):
+def procesar_directorio(directorio, comprimir=False):
     """
     Procesa todos los archivos Excel en un directorio.
     
     Args:
         directorio (str): Ruta del directorio a procesar
+        comprimir (bool): Si es True los CSV se escriben comprimidos con gzip
     """
     if not verificar_dependencias():
         return
@@ -80,19 +322,30 @@ def procesar_directorio(directorio):
     
     logger.info(f"Se encontraron {len(archivos_excel)} archivos Excel para procesar")
     
-    for archivo in archivos_excel:
-        if convertir_excel_a_csv(str(archivo)):
-            archivos_procesados += 1
-        else:
-            archivos_fallidos += 1
+    # Cada archivo se convierte en un proceso independiente
+    max_workers = min(len(archivos_excel), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {executor.submit(convertir_excel_a_csv, str(archivo), comprimir): archivo for archivo in archivos_excel}
+        for futuro in as_completed(futuros):
+            if futuro.result():
+                archivos_procesados += 1
+            else:
+                archivos_fallidos += 1
     
     logger.info(f"Proceso completado. Archivos procesados: {archivos_procesados}, Fallidos: {archivos_fallidos}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convierte a CSV los archivos Excel del directorio actual.")
+    parser.add_argument(
+        '--comprimir', action='store_true',
+        help="escribir los CSV comprimidos con gzip (<nombre>.csv.gz)"
+    )
+    args = parser.parse_args()
+    
     # Directorio actual como directorio por defecto
     directorio_actual = os.getcwd()
     
     try:
-        procesar_directorio(directorio_actual)
+        procesar_directorio(directorio_actual, comprimir=args.comprimir)
     except Exception as e:
         logger.error(f"Error general en el proceso: {str(e)}")
@@ -1,10 +1,19 @@
 import pandas as pd
+import polars as pl
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pacsv
+import csv
+import gzip
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import logging
 from datetime import datetime
-import re
+
+from valores_nulos import VALORES_NULOS
 
 # Configuración del logging
 logging.basicConfig(
@@ -17,19 +26,57 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class TablaNombreColumna(dict):
+    """
+    Tabla para str.translate que conserva [a-z0-9] y cambia cualquier otro
+    carácter por un guion bajo.
+    """
+    def __missing__(self, codigo):
+        self[codigo] = '_'
+        return '_'
+
+TABLA_NOMBRE_COLUMNA = TablaNombreColumna(
+    {ord(c): c for c in 'abcdefghijklmnopqrstuvwxyz0123456789'}
+)
+
+# Tipos explícitos para las columnas de códigos (por nombre limpio), para no
+# depender de la inferencia al leer cada archivo
+TIPOS_COLUMNAS = {
+    'consecutive': pl.Int64,
+    'cod_eve': pl.Int32,
+    'semana': pl.Int32,
+    'ano': pl.Int32,
+    'cod_pre': pl.Int64,
+    'cod_sub': pl.Int32,
+    'edad': pl.Int32,
+    'uni_med': pl.Int32,
+    'cod_pais_o': pl.Int32,
+    'cod_dpto_o': pl.Int32,
+    'cod_mun_o': pl.Int32,
+    'cod_pais_r': pl.Int32,
+    'cod_dpto_r': pl.Int32,
+    'cod_mun_r': pl.Int32,
+    'cod_dpto_n': pl.Int32,
+    'cod_mun_n': pl.Int32,
+}
+
+# Versión de la limpieza guardada en Parquet. Se debe incrementar al cambiar
+# limpiar_datos, optimizar_tipos o TIPOS_COLUMNAS, para no reutilizar datos
+# limpiados con la versión anterior
+VERSION_LIMPIEZA = 1
+
 def limpiar_nombre_columna(columna):
     """
     Limpia el nombre de una columna eliminando caracteres especiales y espacios.
     """
-    # Convertir a minúsculas
-    columna = columna.lower()
-    # Reemplazar espacios y caracteres especiales con guiones bajos
-    columna = re.sub(r'[^a-z0-9]+', '_', columna)
+    # Convertir a minúsculas y reemplazar espacios y caracteres especiales con
+    # guiones bajos
+    columna = columna.lower().translate(TABLA_NOMBRE_COLUMNA)
     # Eliminar guiones bajos múltiples
-    columna = re.sub(r'_+', '_', columna)
+    while '__' in columna:
+        columna = columna.replace('__', '_')
     # Eliminar guiones bajos al inicio y final
-    columna = columna.strip('_')
-    return columna
+    return columna.strip('_')
 
 def limpiar_datos(df):
     """
@@ -37,11 +84,11 @@ def limpiar_datos(df):
     """
     try:
         # Limpiar nombres de columnas
-        df.columns = [limpiar_nombre_columna(col) for col in df.columns]
+        df.columns = df.columns.map(limpiar_nombre_columna)
         
         # Eliminar filas duplicadas
         filas_antes = len(df)
-        df = df.drop_duplicates()
+        df = df.drop_duplicates(ignore_index=True)
         filas_despues = len(df)
         if filas_antes != filas_despues:
             logger.info(f"Se eliminaron {filas_antes - filas_despues} filas duplicadas")
@@ -54,13 +101,13 @@ def limpiar_datos(df):
             except Exception as e:
                 logger.warning(f"No se pudo convertir la columna {col} a fecha: {str(e)}")
         
-        # Reemplazar valores nulos en columnas numéricas con 0
-        columnas_numericas = df.select_dtypes(include=[np.number]).columns
-        df[columnas_numericas] = df[columnas_numericas].fillna(0)
-        
-        # Reemplazar valores nulos en columnas de texto con 'N/A'
-        columnas_texto = df.select_dtypes(include=['object']).columns
-        df[columnas_texto] = df[columnas_texto].fillna('N/A')
+        # Reemplazar valores nulos en una sola pasada: 0 en columnas numéricas
+        # y 'N/A' en columnas de texto (object o texto respaldado por Arrow)
+        valores_relleno = (
+            {col: 0 for col in df.select_dtypes(include=[np.number]).columns}
+            | {col: 'N/A' for col, tipo in df.dtypes.items() if pd.api.types.is_string_dtype(tipo)}
+        )
+        df.fillna(valores_relleno, inplace=True)
         
         return df
         
@@ -68,22 +115,63 @@ def limpiar_datos(df):
         logger.error(f"Error en la limpieza de datos: {str(e)}")
         return df
 
-def segmentar_valle_cauca(df):
+def optimizar_tipos(df):
+    """
+    Reduce el tamaño en memoria del DataFrame ajustando los tipos de datos.
+    
+    Args:
+        df (DataFrame): DataFrame a optimizar
+        
+    Returns:
+        DataFrame: DataFrame con enteros reducidos y metadatos como categorías
+    """
+    # Reducir columnas enteras al tipo más pequeño que admita sus valores
+    for col in df.select_dtypes(include=['integer']).columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    
+    # Las columnas de metadatos tienen un único valor por archivo
+    for col in [limpiar_nombre_columna('año_datos'), 'archivo_origen']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
+    return df
+
+def agrupar_por_departamento(df):
+    """
+    Calcula las posiciones de las filas de cada departamento (cod_dpto_o).
+    
+    Args:
+        df (DataFrame): DataFrame con los datos a agrupar
+        
+    Returns:
+        dict: Posiciones (arreglo de enteros) de las filas por código de departamento
+    """
+    return df.groupby('cod_dpto_o', sort=False).indices
+
+def segmentar_valle_cauca(df, grupos=None):
     """
     Segmenta los datos para el departamento del Valle del Cauca (código 76).
     
     Args:
         df (DataFrame): DataFrame con los datos a segmentar
+        grupos (dict): Resultado de agrupar_por_departamento(df), para reutilizarlo
+            al segmentar varios departamentos; si no se indica se calcula
         
     Returns:
         DataFrame: DataFrame filtrado para el Valle del Cauca
     """
     try:
-        # Filtrar datos del Valle del Cauca usando cod_dpto_o
-        df_valle = df[df['cod_dpto_o'] == 76].copy()
+        # Filtrar datos del Valle del Cauca usando las posiciones de cod_dpto_o
+        if grupos is None:
+            grupos = agrupar_por_departamento(df)
+        posiciones = grupos.get(76, np.array([], dtype='intp'))
         
-        # Agregar información de metadatos
-        df_valle['region'] = 'Valle del Cauca'
+        # Agregar información de metadatos como categoría: un solo texto y
+        # un código int8 por fila
+        region = pd.Categorical.from_codes(
+            np.zeros(len(posiciones), dtype='int8'), categories=['Valle del Cauca']
+        )
+        df_valle = df.take(posiciones).assign(region=region)
         
         logger.info(f"Se encontraron {len(df_valle)} registros para el Valle del Cauca")
         return df_valle
@@ -92,13 +180,199 @@ def segmentar_valle_cauca(df):
         logger.error(f"Error al segmentar datos del Valle del Cauca: {str(e)}")
         return df
 
+def leer_columnas_csv(archivo):
+    """
+    Lee únicamente el encabezado de un archivo CSV.
+    
+    Args:
+        archivo (Path): Ruta del archivo CSV
+        
+    Returns:
+        list: Nombres de las columnas tal como aparecen en el archivo
+        
+    Raises:
+        ValueError: Si el archivo está vacío
+    """
+    abrir = gzip.open if archivo.suffix == '.gz' else open
+    with abrir(archivo, 'rt', encoding='utf-8', newline='') as f:
+        encabezado = next(csv.reader(f), None)
+    if not encabezado:
+        raise ValueError("No columns to parse from file")
+    return encabezado
+
+def listar_archivos_csv(directorio):
+    """
+    Obtiene los archivos Datos_*.csv de un directorio, incluidos los comprimidos
+    con gzip (Datos_*.csv.gz).
+    
+    Si un archivo existe en ambas versiones solo se usa el CSV sin comprimir.
+    
+    Args:
+        directorio (str): Directorio donde buscar los archivos
+        
+    Returns:
+        list: Rutas de los archivos CSV encontrados
+    """
+    archivos_csv = list(Path(directorio).glob("Datos_*.csv"))
+    archivos_csv += [
+        archivo for archivo in Path(directorio).glob("Datos_*.csv.gz")
+        if archivo.with_suffix('') not in archivos_csv
+    ]
+    return archivos_csv
+
+def leer_csv_diferido(archivo, tipos):
+    """
+    Crea una lectura diferida (Polars) de un archivo CSV, comprimido o no.
+    
+    Args:
+        archivo (Path): Ruta del archivo CSV o CSV.gz
+        tipos (dict): Tipos explícitos por nombre original de columna
+        
+    Returns:
+        LazyFrame: Lectura diferida del archivo
+    """
+    # Los textos nulos de pandas (NA, NULL, ...) se leen como nulos y no
+    # impiden leer como número las columnas de TIPOS_COLUMNAS
+    opciones = dict(
+        schema_overrides=tipos,
+        null_values=sorted(VALORES_NULOS),
+        infer_schema_length=None,
+        try_parse_dates=False,
+    )
+    # scan_csv no lee archivos comprimidos; read_csv los descomprime en memoria
+    if archivo.suffix == '.gz':
+        return pl.read_csv(archivo, **opciones).lazy()
+    return pl.scan_csv(archivo, **opciones)
+
+def escribir_csv(df, ruta, incluir_encabezado):
+    """
+    Escribe un DataFrame en un archivo CSV usando el escritor de Arrow.
+    
+    Las columnas de fecha sin hora se escriben como AAAA-MM-DD y las de fecha
+    y hora como AAAA-MM-DD HH:MM:SS, con solo los decimales de segundo que
+    hagan falta, igual que pandas. A diferencia de pandas, Arrow escribe los decimales enteros sin
+    '.0' (0.0 como 0) y encierra entre comillas todos los textos; los valores
+    leídos desde el CSV son los mismos.
+    
+    Args:
+        df (DataFrame): DataFrame a escribir
+        ruta (str): Ruta del archivo CSV
+        incluir_encabezado (bool): Si es True se crea el archivo con encabezado;
+            si es False las filas se agregan al final del archivo existente
+    """
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    
+    # Arrow escribe las fechas con toda la precisión del tipo (nanosegundos);
+    # cada columna de fecha y hora se pasa al tipo más corto que no pierde datos:
+    # solo fecha si todas las horas son 00:00, luego segundos, milisegundos...
+    for i, campo in enumerate(tabla.schema):
+        if pa.types.is_timestamp(campo.type):
+            columna = tabla.column(i)
+            tipos = [pa.date32()] + [pa.timestamp(unidad, tz=campo.type.tz) for unidad in ('s', 'ms', 'us')]
+            for tipo in tipos:
+                convertida = pc.cast(columna, tipo, safe=False)
+                if pc.all(pc.equal(pc.cast(convertida, campo.type), columna)).as_py() is not False:
+                    tabla = tabla.set_column(i, campo.name, convertida)
+                    break
+    
+    with open(ruta, 'wb' if incluir_encabezado else 'ab') as f:
+        pacsv.write_csv(tabla, f, write_options=pacsv.WriteOptions(include_header=incluir_encabezado))
+
+def ruta_cache_parquet(archivo):
+    """
+    Obtiene la ruta del archivo Parquet con los datos limpios de un CSV.
+    
+    Args:
+        archivo (Path): Ruta del archivo CSV o CSV.gz
+        
+    Returns:
+        Path: Ruta del archivo Parquet junto al CSV (Datos_AAAA_....limpio_vN.parquet,
+            con N = VERSION_LIMPIEZA)
+    """
+    nombre_base = archivo.name.removesuffix('.gz').removesuffix('.csv')
+    return archivo.with_name(f"{nombre_base}.limpio_v{VERSION_LIMPIEZA}.parquet")
+
+def leer_y_limpiar_archivo(archivo, encabezado):
+    """
+    Lee y limpia un archivo CSV de datos y guarda el resultado en Parquet.
+    
+    Se ejecuta en un proceso independiente por archivo, por lo que los errores
+    se registran aquí y no se propagan. Se devuelve la ruta del Parquet y no el
+    DataFrame, para no enviar los datos de vuelta al proceso principal.
+    
+    Args:
+        archivo (Path): Ruta del archivo CSV
+        encabezado (list): Nombres originales de las columnas del archivo
+        
+    Returns:
+        tuple: Año de los datos y ruta del Parquet limpio, o None si hubo un error
+    """
+    try:
+        logger.info(f"Leyendo archivo: {archivo}")
+        
+        # Extraer el año del nombre del archivo (formato Datos_AAAA_...)
+        año = archivo.name[6:10]
+        if not (archivo.name.startswith('Datos_') and año.isdigit() and len(año) == 4):
+            año = 'Desconocido'
+        
+        # Usar los datos limpios de una ejecución anterior si el CSV no cambió
+        ruta_parquet = ruta_cache_parquet(archivo)
+        if ruta_parquet.exists() and ruta_parquet.stat().st_mtime >= archivo.stat().st_mtime:
+            logger.info(f"Usando datos limpios guardados en: {ruta_parquet}")
+            return año, ruta_parquet
+        
+        # Tipos explícitos con los nombres originales de este archivo
+        tipos = {
+            columna: TIPOS_COLUMNAS[limpiar_nombre_columna(columna)]
+            for columna in encabezado
+            if limpiar_nombre_columna(columna) in TIPOS_COLUMNAS
+        }
+        
+        # Normalizar nombres de columnas y agregar columnas de metadatos
+        # (los duplicados se eliminan en limpiar_datos)
+        datos = (
+            leer_csv_diferido(archivo, tipos)
+            .rename(limpiar_nombre_columna)
+            .with_columns(
+                pl.lit(año).alias('año_datos'),
+                pl.lit(archivo.name).alias('archivo_origen'),
+            )
+            .collect()
+        )
+        
+        # Polars lee como texto las columnas sin ningún valor; pandas las lee
+        # como numéricas, así que se rellenan con 0 y no con 'N/A'
+        datos = datos.with_columns(
+            pl.col(col).cast(pl.Float64) for col in datos.columns
+            if datos[col].null_count() == datos.height
+        )
+        
+        # Las columnas pasan a pandas respaldadas por Arrow, sin copiar los
+        # buffers de Polars
+        df = datos.to_pandas(use_pyarrow_extension_array=True)
+        
+        # Limpiar datos
+        df = optimizar_tipos(limpiar_datos(df))
+        
+        # Guardar los datos limpios, que también sirven para las próximas ejecuciones
+        df.to_parquet(ruta_parquet, compression='zstd', index=False)
+        return año, ruta_parquet
+        
+    except Exception as e:
+        logger.error(f"Error al procesar {archivo}: {str(e)}")
+        return None
+
 def combinar_y_limpiar_archivos_csv(directorio, nombre_archivo_salida=None):
     """
     Combina y limpia todos los archivos CSV en un directorio.
+    
+    Los archivos se leen y limpian en paralelo (un proceso por archivo) y se
+    agregan a los CSV de salida uno por uno, en orden, de modo que el proceso
+    principal solo mantiene un archivo en memoria a la vez.
     """
     try:
         # Obtener todos los archivos CSV en el directorio
-        archivos_csv = list(Path(directorio).glob("Datos_*.csv"))
+        archivos_csv = listar_archivos_csv(directorio)
         
         if not archivos_csv:
             logger.warning(f"No se encontraron archivos CSV en {directorio}")
@@ -106,96 +380,124 @@ def combinar_y_limpiar_archivos_csv(directorio, nombre_archivo_salida=None):
         
         logger.info(f"Se encontraron {len(archivos_csv)} archivos CSV para procesar")
         
-        # Lista para almacenar todos los DataFrames
-        dfs = []
-        
-        # Leer cada archivo CSV
+        # Unión de columnas de todos los archivos (no todos tienen las mismas),
+        # con los nombres que deja limpiar_datos
+        # Los archivos cuyo encabezado no se puede leer se omiten
+        encabezados = {}
         for archivo in archivos_csv:
             try:
-                logger.info(f"Leyendo archivo: {archivo}")
-                df = pd.read_csv(archivo, encoding='utf-8', low_memory=False)
-                
-                # Extraer el año del nombre del archivo
-                match = re.search(r'Datos_(\d{4})', archivo.name)
-                año = match.group(1) if match else 'Desconocido'
-                
-                # Agregar columnas de metadatos
-                df['año_datos'] = año
-                df['archivo_origen'] = archivo.name
-                
-                # Limpiar datos
-                df = limpiar_datos(df)
-                
-                dfs.append(df)
-                logger.info(f"Archivo {archivo.name} procesado correctamente")
-                
+                encabezados[archivo] = leer_columnas_csv(archivo)
             except Exception as e:
                 logger.error(f"Error al procesar {archivo}: {str(e)}")
-                continue
         
-        if not dfs:
+        archivos_csv = list(encabezados)
+        if not archivos_csv:
             logger.error("No se pudo procesar ningún archivo CSV")
             return
         
-        # Combinar todos los DataFrames
-        df_combinado = pd.concat(dfs, ignore_index=True)
+        columnas = []
+        for encabezado in encabezados.values():
+            for columna in encabezado + ['año_datos', 'archivo_origen']:
+                columna = limpiar_nombre_columna(columna)
+                if columna not in columnas:
+                    columnas.append(columna)
         
         # Generar nombre del archivo de salida si no se proporciona
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         if nombre_archivo_salida is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             nombre_archivo_salida = f"datos_combinados_limpios_{timestamp}.csv"
         
-        # Guardar el archivo combinado completo
         ruta_salida = os.path.join(directorio, nombre_archivo_salida)
-        df_combinado.to_csv(ruta_salida, index=False, encoding='utf-8')
-        
-        # Segmentar y guardar datos del Valle del Cauca
-        df_valle = segmentar_valle_cauca(df_combinado)
         ruta_valle = os.path.join(directorio, f"datos_valle_cauca_{timestamp}.csv")
-        df_valle.to_csv(ruta_valle, index=False, encoding='utf-8')
+        
+        # Contadores para los reportes de estadísticas
+        registros_por_año = Counter()
+        registros_valle_por_año = Counter()
+        escribir_encabezado = True
+        
+        # Leer y limpiar los archivos en paralelo; los resultados llegan en el
+        # orden de archivos_csv y se agregan a las salidas
+        max_workers = min(len(archivos_csv), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            resultados = executor.map(
+                leer_y_limpiar_archivo,
+                archivos_csv,
+                [encabezados[archivo] for archivo in archivos_csv],
+            )
+            for archivo, resultado in zip(archivos_csv, resultados):
+                if resultado is None:
+                    continue
+                
+                try:
+                    # Cargar los datos limpios y alinear con el encabezado común
+                    año, ruta_parquet = resultado
+                    df = pd.read_parquet(ruta_parquet).reindex(columns=columnas)
+                    
+                    # Segmentar datos del Valle del Cauca
+                    df_valle = segmentar_valle_cauca(df)
+                    
+                    # Agregar a los archivos de salida
+                    escribir_csv(df, ruta_salida, escribir_encabezado)
+                    escribir_csv(df_valle, ruta_valle, escribir_encabezado)
+                    escribir_encabezado = False
+                    
+                    registros_por_año[año] += len(df)
+                    registros_valle_por_año[año] += len(df_valle)
+                    logger.info(f"Archivo {archivo.name} procesado correctamente")
+                    
+                except Exception as e:
+                    logger.error(f"Error al procesar {archivo}: {str(e)}")
+                    continue
+        
+        if escribir_encabezado:
+            logger.error("No se pudo procesar ningún archivo CSV")
+            return
         
         # Generar reporte de estadísticas
-        generar_reporte_estadisticas(df_combinado, directorio)
-        generar_reporte_estadisticas(df_valle, directorio, prefijo="valle_cauca_")
+        generar_reporte_estadisticas(registros_por_año, columnas, directorio, timestamp=timestamp)
+        generar_reporte_estadisticas(
+            registros_valle_por_año, columnas + ['region'], directorio, prefijo="valle_cauca_", timestamp=timestamp
+        )
         
         logger.info(f"Archivos combinados y limpios exitosamente en: {ruta_salida}")
         logger.info(f"Datos del Valle del Cauca guardados en: {ruta_valle}")
-        logger.info(f"Total de registros combinados: {len(df_combinado)}")
-        logger.info(f"Total de registros Valle del Cauca: {len(df_valle)}")
+        logger.info(f"Total de registros combinados: {sum(registros_por_año.values())}")
+        logger.info(f"Total de registros Valle del Cauca: {sum(registros_valle_por_año.values())}")
         
     except Exception as e:
         logger.error(f"Error general en el proceso: {str(e)}")
 
-def generar_reporte_estadisticas(df, directorio, prefijo=""):
+def generar_reporte_estadisticas(registros_por_año, columnas, directorio, prefijo="", timestamp=None):
     """
-    Genera un reporte de estadísticas básicas del DataFrame.
+    Genera un reporte de estadísticas básicas de un conjunto de datos.
     
     Args:
-        df (DataFrame): DataFrame a analizar
+        registros_por_año (Counter): Número de registros por año de los datos
+        columnas (list): Columnas del conjunto de datos
         directorio (str): Directorio donde guardar el reporte
         prefijo (str): Prefijo para el nombre del archivo de reporte
+        timestamp (str): Marca de tiempo para el nombre del archivo; si no se
+            indica se usa la fecha y hora actual
     """
     try:
         # Crear reporte
         reporte = []
         reporte.append("REPORTE DE ESTADÍSTICAS")
         reporte.append("=" * 50)
-        reporte.append(f"\nTotal de registros: {len(df)}")
-        reporte.append(f"Total de columnas: {len(df.columns)}")
+        reporte.append(f"\nTotal de registros: {sum(registros_por_año.values())}")
+        reporte.append(f"Total de columnas: {len(columnas)}")
         
-        # Estadísticas por año
+        # Estadísticas por año, ordenadas por año
         reporte.append("\nRegistros por año:")
-        if 'año_datos' in df.columns:
-            for año, count in df['año_datos'].value_counts().items():
-                reporte.append(f"- {año}: {count} registros")
+        reporte.extend(f"- {año}: {count} registros" for año, count in sorted(registros_por_año.items()))
         
         # Información de columnas
         reporte.append("\nColumnas en el dataset:")
-        for columna in df.columns:
-            reporte.append(f"- {columna}")
+        reporte.extend(f"- {columna}" for columna in columnas)
         
         # Guardar reporte
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         ruta_reporte = os.path.join(directorio, f"{prefijo}reporte_estadisticas_{timestamp}.txt")
         
         with open(ruta_reporte, 'w', encoding='utf-8') as f:
@@ -0,0 +1,7 @@
+# Textos que pandas interpreta como valores nulos al leer CSV o Excel
+# (na_values por defecto). Los usan la conversión de Excel a CSV y la lectura
+# de los CSV al combinarlos, para tratar los nulos igual que pandas.
+VALORES_NULOS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+}